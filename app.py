@@ -9,7 +9,7 @@ import os
 # Retrieve the admin password from environment variables
 admin_password = os.environ.get('ADMIN_PASSWORD')
 
-from flask import render_template, request, redirect, url_for, abort, flash
+from flask import render_template, request, redirect, url_for, abort, flash, session
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from datetime import datetime, timedelta
@@ -21,6 +21,12 @@ import psycopg2
 import re
 import logging
 import sys
+import gzip
+import json
+import glob
+import fcntl
+from contextlib import contextmanager
+import click
 from flask_mail import Mail, Message
 from flask import jsonify
 
@@ -42,6 +48,9 @@ if os.environ.get('FLASK_ENV') == 'development':
 else:
     app.config.from_object('config.ProductionConfig')
 
+if not app.config['HISTORY_ARCHIVE_DIR']:
+    app.config['HISTORY_ARCHIVE_DIR'] = os.path.join(app.instance_path, 'history_archive')
+
 database_url = app.config['SQLALCHEMY_DATABASE_URI']
 
 if database_url.startswith("postgres://"):
@@ -56,6 +65,12 @@ class User(db.Model):
     username = db.Column(db.String(80), unique=True, nullable=False)
     chromebooks = db.relationship('Chromebook', backref='user', lazy=True)
 
+class Location(db.Model):
+    # A charging cart; each kiosk is scoped to one via /cart/<id>
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), unique=True, nullable=False)
+    chromebooks = db.relationship('Chromebook', backref='location', lazy=True)
+
 def default_history():
     return []
 
@@ -68,23 +83,93 @@ class Chromebook(db.Model):
     status = db.Column(db.String(80), default='Available', nullable=False)
     history = db.relationship('ChromebookHistory', backref='chromebook', lazy=True, cascade="all, delete")
     email_sent = db.Column(db.Boolean, default=False, nullable=False)
+    reminder = db.relationship('LoanReminder', backref='chromebook', uselist=False, lazy=True, cascade="all, delete-orphan")
+    location_id = db.Column(db.Integer, db.ForeignKey('location.id', ondelete='SET NULL'), nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_chromebook_location_id_status', 'location_id', 'status'),
+    )
     
 class ChromebookHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     chromebook_id = db.Column(db.Integer, db.ForeignKey('chromebook.id', ondelete='CASCADE'), nullable=False)
     username = db.Column(db.String(80), nullable=False)
-    action_date = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    action_date = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
     action = db.Column(db.String(80), nullable=False)  # Can be 'Loaned' or 'Returned'
 
+class LoanReminder(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    chromebook_id = db.Column(db.Integer, db.ForeignKey('chromebook.id', ondelete='CASCADE'), unique=True, nullable=False)
+    stage = db.Column(db.Integer, default=0, nullable=False)  # Index into REMINDER_STAGES of the next stage to send
+    next_action_at = db.Column(db.DateTime, nullable=True, index=True)  # None once every stage has been sent
+    failures = db.Column(db.Integer, default=0, nullable=False)  # Failed sends of the current stage
+
+def reminder_due_at(loaned_at, stage):
+    stages = app.config['REMINDER_STAGES']
+    if stage >= len(stages):
+        return None
+    return loaned_at + timedelta(hours=stages[stage]['after_hours'])
+
+def advance_reminder(reminder, loaned_at, sent=True):
+    # Only wait the minimum gap after a stage that was actually sent; a stage given up on shouldn't delay the next
+    reminder.stage += 1
+    reminder.failures = 0
+    next_action_at = reminder_due_at(loaned_at, reminder.stage)
+    if next_action_at:
+        min_gap = timedelta(hours=app.config['REMINDER_MIN_GAP_HOURS']) if sent else timedelta()
+        next_action_at = max(next_action_at, datetime.utcnow() + min_gap)
+    reminder.next_action_at = next_action_at
+
+def overdue_threshold():
+    # A loan counts as overdue once the first reminder stage is due
+    return timedelta(hours=app.config['REMINDER_STAGES'][0]['after_hours'])
+
+def format_email(username):
+    return username + ('' if '@tiffingirls.org' in username else '@tiffingirls.org')
+
+def format_display_name(username):
+    username = re.sub(r'^\d{2}|@tiffingirls.org$', '', username)
+    return f'{username[0].upper()} {username[1:].capitalize()}'
+
+def kiosk_home_url(location_id=None):
+    # Send a cart kiosk back to its own page rather than the whole-school one
+    if location_id is None:
+        location_id = session.get('kiosk_location_id')
+    if location_id is not None and Location.query.get(location_id):
+        return url_for('home', location_id=location_id)
+    return url_for('home')
+
+def form_location_id():
+    # Returns (valid, location_id); the empty "Unassigned" option is valid and maps to None
+    location_id = request.form.get('location_id')
+    if not location_id:
+        return True, None
+    location = Location.query.get(int(location_id)) if location_id.isdigit() else None
+    if not location:
+        return False, None
+    return True, location.id
+
 @app.route('/')
-def home():
-    chromebooks = Chromebook.query.filter_by(status='Available').all()
+@app.route('/cart/<int:location_id>')
+def home(location_id=None):
+    chromebook_query = Chromebook.query
+    location = None
+    if location_id is not None:
+        location = Location.query.get_or_404(location_id)
+        chromebook_query = chromebook_query.filter_by(location_id=location.id)
+        home_url = url_for('home', location_id=location.id)
+        session['kiosk_location_id'] = location.id
+    else:
+        home_url = url_for('home')
+        session.pop('kiosk_location_id', None)
+
+    chromebooks = chromebook_query.filter_by(status='Available').all()
     chromebooks.sort(key=lambda x: int(x.identifier))
 
-    loaned_chromebooks = Chromebook.query.filter(Chromebook.status=='Loaned').all()
+    loaned_chromebooks = chromebook_query.filter(Chromebook.status=='Loaned').all()
     loaned_chromebooks.sort(key=lambda x: int(x.identifier))
 
-    return render_template('home.html', chromebooks=chromebooks, loaned_chromebooks=loaned_chromebooks)
+    return render_template('home.html', chromebooks=chromebooks, loaned_chromebooks=loaned_chromebooks, location=location, home_url=home_url)
 
 @app.route('/loan', methods=['POST'])
 def loan_chromebook():
@@ -107,14 +192,11 @@ def loan_chromebook():
     chromebook.user_id = user.id
     chromebook.loaned_at = datetime.utcnow()
     chromebook.email_sent = False
+    chromebook.reminder = LoanReminder(stage=0, next_action_at=reminder_due_at(chromebook.loaned_at, 0))
     
     history_entry = ChromebookHistory(chromebook_id=chromebook.id, username=user.username, action='Loaned')
     db.session.add(history_entry)
 
-    if len(chromebook.history) > 6:
-        oldest_entry = ChromebookHistory.query.filter_by(chromebook_id=chromebook.id).order_by(ChromebookHistory.action_date).first()
-        db.session.delete(oldest_entry)
-
     db.session.commit()
     return jsonify({'success': True, 'message': f'Device {chromebook.identifier} Loaned. Thank You. Please return by 4pm'}), 200
 
@@ -137,14 +219,11 @@ def return_chromebook():
         chromebook.user_id = None
         chromebook.loaned_at = None
         chromebook.email_sent = False
+        chromebook.reminder = None
 
         history_entry = ChromebookHistory(chromebook_id=chromebook.id, username=user.username, action='Returned')
         db.session.add(history_entry)
 
-        if len(chromebook.history) > 6:
-            oldest_entry = ChromebookHistory.query.filter_by(chromebook_id=chromebook.id).order_by(ChromebookHistory.action_date).first()
-            db.session.delete(oldest_entry)
-
         db.session.commit()
         return jsonify({'success': True, 'message': 'Thank you!'}), 200
     else:
@@ -158,12 +237,13 @@ def admin():
         password = request.form.get('password')
         if password != admin_password:
             flash('Incorrect password. Please try again.')
-            return redirect(url_for('home'))
+            return redirect(kiosk_home_url(request.form.get('location_id', type=int)))
 
     users = User.query.all()
     now = datetime.utcnow()
+    overdue_after = overdue_threshold()
 
-    chromebooks = Chromebook.query
+    chromebooks = Chromebook.query.options(db.selectinload(Chromebook.reminder))
     if filter_by == 'all':
         chromebooks = chromebooks.all()
     elif filter_by == 'available':
@@ -171,49 +251,65 @@ def admin():
     elif filter_by == 'loaned':
         chromebooks = chromebooks.filter_by(status='Loaned').all()
     elif filter_by == 'overdue':
-        chromebooks = chromebooks.filter(Chromebook.status == 'Loaned', now - Chromebook.loaned_at > timedelta(hours=24)).all()
+        chromebooks = chromebooks.filter(Chromebook.status == 'Loaned', now - Chromebook.loaned_at > overdue_after).all()
     elif filter_by == 'missing':
         chromebooks = chromebooks.filter_by(status='Missing').all()
 
     chromebooks = sorted(chromebooks, key=lambda cb: int(cb.identifier))  
 
-    overdue_chromebook_emails = [chromebook.user.username + ('' if '@tiffingirls.org' in chromebook.user.username else '@tiffingirls.org') for chromebook in chromebooks if chromebook.status == 'Loaned' and chromebook.email_sent == False and (now - chromebook.loaned_at > timedelta(hours=24))]
-
-    overdue_chromebook_usernames = [re.sub(r'^\d{2}|@tiffingirls.org$', '', chromebook.user.username) for chromebook in chromebooks if chromebook.status == 'Loaned' and (now - chromebook.loaned_at > timedelta(hours=24))]
-    overdue_chromebook_names = [f'{username[0].upper()} {username[1:].capitalize()}' for username in overdue_chromebook_usernames]
-
-    reception_email = "reception@tiffingirls.org"
-    reception_subject = quote("Overdue Chromebook Report")
-    reception_body = quote(f"Dear Reception,\n\nThe following users have Chromebooks that are overdue for return:\n\n" + "\n".join(overdue_chromebook_names) + "\n\nPlease follow up with them.\n\nThank you.")
-    reception_mailto_link = f'mailto:{reception_email}?subject={reception_subject}&body={reception_body}'
-    
-    available_count = Chromebook.query.filter_by(status='Available').count()
-    loaned_count = Chromebook.query.filter_by(status='Loaned').count()
-    missing_count = Chromebook.query.filter_by(status='Missing').count()
-    overdue_count = Chromebook.query.filter(Chromebook.status == 'Loaned', now - Chromebook.loaned_at > timedelta(hours=24)).count()
-    total_chromebooks = Chromebook.query.count()
+    # Fetch only the last 6 history entries per Chromebook in one windowed query
+    history_rank = db.func.row_number().over(
+        partition_by=ChromebookHistory.chromebook_id,
+        order_by=ChromebookHistory.action_date.desc()
+    ).label('rank')
+    ranked_history = db.session.query(ChromebookHistory.id, history_rank).filter(
+        ChromebookHistory.chromebook_id.in_([chromebook.id for chromebook in chromebooks])
+    ).subquery()
+    recent_history = {}
+    for history_entry in ChromebookHistory.query.join(
+        ranked_history, ChromebookHistory.id == ranked_history.c.id
+    ).filter(ranked_history.c.rank <= 6).order_by(ChromebookHistory.action_date):
+        recent_history.setdefault(history_entry.chromebook_id, []).append(history_entry)
+
+    locations = Location.query.order_by(Location.name).all()
+
+    # Count every cart/status pair in one grouped query and derive the totals from it
+    cart_counts = {}
+    status_counts = {}
+    for location_id, status, count in db.session.query(Chromebook.location_id, Chromebook.status, db.func.count(Chromebook.id)).group_by(Chromebook.location_id, Chromebook.status):
+        cart_counts.setdefault(location_id, {})[status] = count
+        status_counts[status] = status_counts.get(status, 0) + count
+
+    available_count = status_counts.get('Available', 0)
+    loaned_count = status_counts.get('Loaned', 0)
+    missing_count = status_counts.get('Missing', 0)
+    overdue_count = Chromebook.query.filter(Chromebook.status == 'Loaned', now - Chromebook.loaned_at > overdue_after).count()
+    total_chromebooks = sum(status_counts.values())
     
-    return render_template('admin.html', chromebooks=chromebooks, users=users, reception_mailto_link=reception_mailto_link, now=now, timedelta=timedelta, available_count=available_count, loaned_count=loaned_count, overdue_count=overdue_count, missing_count=missing_count, total_chromebooks=total_chromebooks)
+    return render_template('admin.html', chromebooks=chromebooks, users=users, home_url=kiosk_home_url(), recent_history=recent_history, locations=locations, cart_counts=cart_counts, reminder_stages=app.config['REMINDER_STAGES'], now=now, overdue_after=overdue_after, available_count=available_count, loaned_count=loaned_count, overdue_count=overdue_count, missing_count=missing_count, total_chromebooks=total_chromebooks)
 
 @app.route('/prepare_overdue_emails')
 def prepare_overdue_emails():
     # Mark the Chromebooks as having an email sent
     now = datetime.utcnow()
+    overdue_after = overdue_threshold()
     overdue_chromebooks = Chromebook.query.filter(
         Chromebook.status == 'Loaned',
-        now - Chromebook.loaned_at > timedelta(hours=24),
+        now - Chromebook.loaned_at > overdue_after,
         Chromebook.email_sent == False
     ).all()
 
+    stages = app.config['REMINDER_STAGES']
     for chromebook in overdue_chromebooks:
         chromebook.email_sent = True
+        # Count the manual email as the user reminder stage so the scheduler doesn't send it again
+        reminder = chromebook.reminder
+        if reminder and reminder.stage < len(stages) and stages[reminder.stage]['recipient'] == 'user':
+            advance_reminder(reminder, chromebook.loaned_at)
     db.session.commit()
 
     # Redirect to the mailto link
-    overdue_chromebook_emails = [
-        chromebook.user.username + ('' if '@tiffingirls.org' in chromebook.user.username else '@tiffingirls.org')
-        for chromebook in overdue_chromebooks
-    ]
+    overdue_chromebook_emails = [format_email(chromebook.user.username) for chromebook in overdue_chromebooks]
     subject = quote("Overdue Chromebook Reminder")
     body = quote("Dear User,\n\nOur records indicate that you have a Chromebook that is overdue for return. Please return it as soon as possible.\n\nThank you.")
     mailto_link = f'mailto:{";".join(overdue_chromebook_emails)}?subject={subject}&body={body}'
@@ -223,9 +319,13 @@ def prepare_overdue_emails():
 def add_chromebook():
     identifier = request.form.get('identifier')
     serial_number = request.form.get('serial_number')
+    valid_location, location_id = form_location_id()
+    if not valid_location:
+        flash('Cart not found.', 'danger')
+        return redirect(url_for('admin'))
     
     if identifier and serial_number:
-        chromebook = Chromebook(identifier=identifier, serial_number=serial_number)
+        chromebook = Chromebook(identifier=identifier, serial_number=serial_number, location_id=location_id)
         db.session.add(chromebook)
         db.session.commit()
     
@@ -236,15 +336,45 @@ def edit_chromebook(chromebook_id):
     chromebook = Chromebook.query.get(chromebook_id)
     if not chromebook:
         abort(404)
+    valid_location, location_id = form_location_id()
+    if not valid_location:
+        flash('Cart not found.', 'danger')
+        return redirect(url_for('admin'))
     chromebook.identifier = request.form.get('identifier')
     chromebook.serial_number = request.form.get('serial_number')
+    chromebook.location_id = location_id
     db.session.commit()
     return redirect(url_for('admin'))
 
+@app.route('/add_location', methods=['POST'])
+def add_location():
+    name = request.form.get('name')
+
+    if name:
+        if Location.query.filter_by(name=name).first():
+            flash(f'Cart {name} already exists.', 'danger')
+        else:
+            db.session.add(Location(name=name))
+            db.session.commit()
+            flash(f'Cart {name} added.', 'success')
+
+    return redirect(url_for('admin'))
+
 @app.route('/delete_chromebook/<int:chromebook_id>', methods=['POST'])
 def delete_chromebook(chromebook_id):
     chromebook = Chromebook.query.get_or_404(chromebook_id)
-    
+
+    # Archive the device's live history first, since deleting the device deletes its history rows
+    history_entries = ChromebookHistory.query.filter_by(chromebook_id=chromebook.id).order_by(ChromebookHistory.id).all()
+    if history_entries:
+        try:
+            with history_archive_lock():
+                write_history_archive([(entry, chromebook) for entry in history_entries])
+        except OSError as e:
+            logging.error(f"Error archiving history for Chromebook {chromebook.identifier}: {e}")
+            flash(f'Chromebook {chromebook.identifier} was not deleted because its history could not be archived.', 'danger')
+            return redirect(url_for('admin'))
+
     db.session.delete(chromebook)
     db.session.commit()
     return redirect(url_for('admin'))
@@ -274,57 +404,323 @@ def mark_found(chromebook_id):
         flash('Chromebook not found.', 'danger')
     return redirect(url_for('admin'))
 
+def send_user_reminders(stage, rows):
+    # Group the due reminders by user so each user gets one email for all their overdue Chromebooks
+    rows_by_user = {}
+    for row in rows:
+        rows_by_user.setdefault(row[2].id, []).append(row)
+
+    delivered = []
+    for user_rows in rows_by_user.values():
+        user = user_rows[0][2]
+        recipient_email = format_email(user.username)
+        chromebook_identifiers = [chromebook.identifier for _, chromebook, _ in user_rows]
+        msg = Message('Overdue Chromebook Reminder', sender=app.config['MAIL_USERNAME'], recipients=[recipient_email])
+        msg.body = f'Dear {user.username},\n\nYour borrowed Chromebooks with IDs: {", ".join(chromebook_identifiers)} are now overdue. Please return them as soon as possible.\n\nThank you!'
+
+        try:
+            mail.send(msg)
+            logging.info(f"Sent {stage['name']} email to {recipient_email} for Chromebook IDs: {', '.join(chromebook_identifiers)}")
+        except Exception as e:
+            logging.error(f"Error sending email to {recipient_email}: {e}")
+            continue
+        delivered.extend(user_rows)
+    return delivered
+
+def send_reception_escalation(stage, rows):
+    recipient_email = app.config['RECEPTION_EMAIL']
+    overdue_lines = [f'{format_display_name(user.username)} (Chromebook {chromebook.identifier})' for _, chromebook, user in rows]
+    msg = Message('Overdue Chromebook Report', sender=app.config['MAIL_USERNAME'], recipients=[recipient_email])
+    msg.body = "Dear Reception,\n\nThe following users have Chromebooks that are overdue for return:\n\n" + "\n".join(overdue_lines) + "\n\nPlease follow up with them.\n\nThank you."
+
+    try:
+        mail.send(msg)
+        logging.info(f"Sent {stage['name']} email to {recipient_email} for {len(rows)} overdue Chromebooks.")
+    except Exception as e:
+        logging.error(f"Error sending email to {recipient_email}: {e}")
+        return []
+    return rows
+
+REMINDER_SENDERS = {
+    'user': send_user_reminders,
+    'reception': send_reception_escalation,
+}
+
 def send_overdue_emails():
+    # Work through the reminder queue in batches, touching only reminders that are due
     with app.app_context():
         now = datetime.utcnow()
-        try:
-            overdue_chromebooks = Chromebook.query.filter(
-                Chromebook.status == 'Loaned',
-                now - Chromebook.loaned_at > timedelta(hours=24),
-                Chromebook.email_sent == False
-            ).all()
-            logging.info(f"Fetched {len(overdue_chromebooks)} overdue Chromebooks for sending emails.")
-        except Exception as e:
-            logging.error(f"Error fetching overdue chromebooks: {e}")
-            return
-
-        # Group overdue Chromebooks by user
-        overdue_by_user = {}
-        for chromebook in overdue_chromebooks:
-            user_id = chromebook.user_id
-            if user_id not in overdue_by_user:
-                overdue_by_user[user_id] = []
-            overdue_by_user[user_id].append(chromebook)
-
-        for user_id, user_overdue_chromebooks in overdue_by_user.items():
-            user = User.query.get(user_id)
-            if not user:
-                logging.warning(f"No user found for user ID: {user_id}. Skipping email.")
-                continue  # Skip if no user is associated with the Chromebooks
-
-            # Ensure the recipient's email is correctly formatted
-            recipient_email = user.username + ('' if '@tiffingirls.org' in user.username else '@tiffingirls.org')
-
-            # Create email content for all of the user's overdue Chromebooks
-            chromebook_identifiers = [cb.identifier for cb in user_overdue_chromebooks]
-            msg = Message('Overdue Chromebook Reminder', sender=app.config['MAIL_USERNAME'], recipients=[recipient_email])
-            msg.body = f'Dear {user.username},\n\nYour borrowed Chromebooks with IDs: {", ".join(chromebook_identifiers)} are now overdue. Please return them as soon as possible.\n\nThank you!'
+        stages = app.config['REMINDER_STAGES']
+        batch_size = app.config['REMINDER_BATCH_SIZE']
+        # Always push failed sends past this run's cutoff so the loop can't fetch them again
+        retry_delay = timedelta(minutes=max(app.config['REMINDER_RETRY_MINUTES'], 1))
+
+        while True:
+            due_query = db.session.query(LoanReminder, Chromebook, User).join(
+                Chromebook, LoanReminder.chromebook_id == Chromebook.id
+            ).outerjoin(
+                User, Chromebook.user_id == User.id
+            ).filter(
+                LoanReminder.next_action_at <= now
+            )
+            try:
+                due = due_query.order_by(LoanReminder.next_action_at).limit(batch_size).all()
+
+                # Pull in the other due reminders of users in this batch, so each user gets one email per run
+                user_ids = {user.id for _, _, user in due if user}
+                if user_ids:
+                    due += due_query.filter(
+                        Chromebook.user_id.in_(user_ids),
+                        LoanReminder.id.notin_([reminder.id for reminder, _, _ in due])
+                    ).all()
+                logging.info(f"Fetched {len(due)} due reminders for sending emails.")
+            except Exception as e:
+                logging.error(f"Error fetching due reminders: {e}")
+                return
+
+            if not due:
+                break
+
+            rows_by_stage = {}
+            for reminder, chromebook, user in due:
+                if not user or not chromebook.loaned_at or reminder.stage >= len(stages):
+                    logging.warning(f"No reminder stage to send for Chromebook {chromebook.identifier}. Closing reminder.")
+                    reminder.next_action_at = None
+                    continue
+                rows_by_stage.setdefault(reminder.stage, []).append((reminder, chromebook, user))
+
+            for stage_index, rows in rows_by_stage.items():
+                stage = stages[stage_index]
+                delivered = REMINDER_SENDERS[stage['recipient']](stage, rows)
+                delivered_ids = {reminder.id for reminder, _, _ in delivered}
+                for reminder, chromebook, _ in rows:
+                    if reminder.id in delivered_ids:
+                        if stage['recipient'] == 'user':
+                            chromebook.email_sent = True
+                        advance_reminder(reminder, chromebook.loaned_at)
+                    else:
+                        reminder.failures += 1
+                        if reminder.failures >= app.config['REMINDER_MAX_FAILURES']:
+                            logging.warning(f"Giving up on {stage['name']} for Chromebook {chromebook.identifier} after {reminder.failures} failed sends.")
+                            advance_reminder(reminder, chromebook.loaned_at, sent=False)
+                        else:
+                            # Push failed sends back so this run moves on; a later run retries them
+                            reminder.next_action_at = datetime.utcnow() + retry_delay
 
             try:
-                mail.send(msg)
-                logging.info(f"Sent overdue reminder email to {recipient_email} for Chromebook IDs: {', '.join(chromebook_identifiers)}")
+                db.session.commit()
+                logging.info(f"Updated {len(due)} reminders in the database.")
             except Exception as e:
-                logging.error(f"Error sending email to {recipient_email}: {e}")
+                db.session.rollback()
+                logging.error(f"Error updating reminders in database: {e}")
+                return
+
+def history_archive_index_path():
+    return os.path.join(app.config['HISTORY_ARCHIVE_DIR'], 'index.json')
+
+@contextmanager
+def history_archive_lock():
+    # Serialise writers (scheduler, CLI, device deletion) so they can't overwrite each other's index entries
+    archive_dir = app.config['HISTORY_ARCHIVE_DIR']
+    os.makedirs(archive_dir, exist_ok=True)
+    with open(os.path.join(archive_dir, '.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def load_history_archive_index():
+    # The index maps each partition file to its date range, row count and the devices/users it contains
+    try:
+        with open(history_archive_index_path()) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_history_archive_index(index):
+    path = history_archive_index_path()
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def history_partition_index(records):
+    dates = [record['action_date'] for record in records]
+    return {
+        'first': min(dates),
+        'last': max(dates),
+        'count': len(records),
+        'identifiers': sorted({record['identifier'] for record in records}),
+        'usernames': sorted({record['username'].lower() for record in records}),
+    }
+
+def history_entry_to_dict(entry, chromebook):
+    return {
+        'id': entry.id,
+        'chromebook_id': entry.chromebook_id,
+        'identifier': chromebook.identifier,
+        'serial_number': chromebook.serial_number,
+        'username': entry.username,
+        'action': entry.action,
+        'action_date': entry.action_date.isoformat(),
+    }
+
+def write_history_archive(entries):
+    # Write (entry, chromebook) pairs, ordered by id, to new partition files and add them to the index.
+    # Callers must hold history_archive_lock().
+    archive_dir = app.config['HISTORY_ARCHIVE_DIR']
+
+    # Group by month; each call writes its own file per month so existing files are never appended to
+    months = {}
+    for entry, chromebook in entries:
+        months.setdefault(entry.action_date.strftime('%Y-%m'), []).append(history_entry_to_dict(entry, chromebook))
+
+    new_partitions = {}
+    for month, records in months.items():
+        year, month_number = month.split('-')
+        partition = f"{year}/{month_number}/history-{month}-{records[0]['id']}-{records[-1]['id']}.jsonl.gz"
+        path = os.path.join(archive_dir, partition)
+        tmp_path = path + '.tmp'
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+        os.replace(tmp_path, path)
+        new_partitions[partition] = history_partition_index(records)
+
+    # Reload so entries saved by anyone since we last looked are kept
+    index = load_history_archive_index()
+    index.update(new_partitions)
+    save_history_archive_index(index)
+    return list(new_partitions)
+
+def rebuild_history_archive_index():
+    # Recreate index.json from the partition files on disk
+    archive_dir = app.config['HISTORY_ARCHIVE_DIR']
+    with history_archive_lock():
+        index = {}
+        for path in sorted(glob.glob(os.path.join(archive_dir, '**', '*.jsonl.gz'), recursive=True)):
+            partition = os.path.relpath(path, archive_dir).replace(os.sep, '/')
+            try:
+                with gzip.open(path, 'rt', encoding='utf-8') as f:
+                    records = [json.loads(line) for line in f]
+            except (OSError, EOFError, ValueError) as e:
+                logging.error(f"Skipping unreadable history archive partition {partition}: {e}")
                 continue
+            if records:
+                index[partition] = history_partition_index(records)
+        save_history_archive_index(index)
+    logging.info(f"Rebuilt history archive index with {len(index)} partitions.")
+    return len(index)
+
+def archive_history(days=None):
+    # Move history older than the retention window into gzipped JSONL files, partitioned by month
+    with app.app_context(), history_archive_lock():
+        if days is None:
+            days = app.config['HISTORY_RETENTION_DAYS']
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        archive_dir = app.config['HISTORY_ARCHIVE_DIR']
+        batch_size = app.config['HISTORY_ARCHIVE_BATCH_SIZE']
+        archived = 0
+
+        while True:
+            try:
+                batch = db.session.query(ChromebookHistory, Chromebook).join(Chromebook).filter(
+                    ChromebookHistory.action_date < cutoff
+                ).order_by(ChromebookHistory.id).limit(batch_size).all()
+            except Exception as e:
+                logging.error(f"Error fetching history for archiving: {e}")
+                return archived
+
+            if not batch:
+                break
 
-            # Mark the Chromebooks as having an email sent
+            # Write the archive and index before deleting, so a failure never loses history.
+            # A rerun after a failed delete can only duplicate rows, and queries dedupe by id.
             try:
-                for cb in user_overdue_chromebooks:
-                    cb.email_sent = True
+                partitions = write_history_archive(batch)
+            except OSError as e:
+                logging.error(f"Error writing history archive: {e}")
+                return archived
+
+            try:
+                ChromebookHistory.query.filter(
+                    ChromebookHistory.id.in_([entry.id for entry, _ in batch])
+                ).delete(synchronize_session=False)
                 db.session.commit()
-                logging.info(f"Marked Chromebook IDs: {', '.join(chromebook_identifiers)} as email_sent=True in the database.")
             except Exception as e:
-                logging.error(f"Error updating Chromebook IDs in database: {e}")
+                db.session.rollback()
+                logging.error(f"Error deleting archived history from database: {e}")
+                return archived
+
+            archived += len(batch)
+            logging.info(f"Archived {len(batch)} history entries older than {cutoff.isoformat()} to {', '.join(partitions)}.")
+
+        logging.info(f"History archiving complete. {archived} entries moved to {archive_dir}.")
+        return archived
+
+def query_history(identifier=None, username=None):
+    # Search the live table and any archive partitions whose index says they can match
+    hot_query = db.session.query(ChromebookHistory, Chromebook).join(Chromebook)
+    if identifier:
+        hot_query = hot_query.filter(Chromebook.identifier == identifier)
+    if username:
+        hot_query = hot_query.filter(db.func.lower(ChromebookHistory.username) == username.lower())
+    results = {entry.id: history_entry_to_dict(entry, chromebook) for entry, chromebook in hot_query.all()}
+
+    archive_dir = app.config['HISTORY_ARCHIVE_DIR']
+    for partition, entry_index in load_history_archive_index().items():
+        if identifier and identifier not in entry_index['identifiers']:
+            continue
+        if username and username.lower() not in entry_index['usernames']:
+            continue
+        try:
+            with gzip.open(os.path.join(archive_dir, partition), 'rt', encoding='utf-8') as f:
+                records = [json.loads(line) for line in f]
+        except (OSError, EOFError, ValueError) as e:
+            # A missing or damaged partition shouldn't take the rest of the audit trail down with it
+            logging.error(f"Skipping unreadable history archive partition {partition}: {e}")
+            continue
+
+        for record in records:
+            if identifier and record['identifier'] != identifier:
+                continue
+            if username and record['username'].lower() != username.lower():
+                continue
+            results.setdefault(record['id'], record)
+
+    return sorted(results.values(), key=lambda record: record['action_date'], reverse=True)
+
+@app.route('/history')
+def history():
+    identifier = request.args.get('chromebook')
+    username = request.args.get('user')
+    if not identifier and not username:
+        return jsonify({'success': False, 'message': 'Provide a chromebook or user to search history.'}), 400
+
+    return jsonify({'success': True, 'history': query_history(identifier=identifier, username=username)}), 200
+
+@app.cli.command('archive-history')
+@click.option('--days', type=int, default=None, help='Archive history older than this many days.')
+def archive_history_command(days):
+    """Move old history out of the database into the compressed archive."""
+    click.echo(f'Archived {archive_history(days)} history entries.')
+
+@app.cli.command('rebuild-history-index')
+def rebuild_history_index_command():
+    """Recreate the archive index by scanning the archived history files."""
+    click.echo(f'Indexed {rebuild_history_archive_index()} history archive partitions.')
+
+@app.cli.command('history')
+@click.option('--chromebook', 'identifier', default=None, help='Chromebook identifier to search for.')
+@click.option('--user', 'username', default=None, help='Username to search for.')
+def history_command(identifier, username):
+    """Show history for a Chromebook or user across the database and the archive."""
+    if not identifier and not username:
+        raise click.UsageError('Provide --chromebook or --user.')
+    for record in query_history(identifier=identifier, username=username):
+        click.echo(f"{record['action_date']}  Chromebook {record['identifier']}  {record['action']} by {record['username']}")
 
 if __name__ == '__main__':
     app.run
\ No newline at end of file
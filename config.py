@@ -4,6 +4,23 @@ class Config:
     # Common configurations
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'default_secret_key'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # History older than this many days is moved out of chromebook_history into the archive
+    HISTORY_RETENTION_DAYS = int(os.environ.get('HISTORY_RETENTION_DAYS', 90))
+    # Must be persistent storage shared with the web process; defaults to the instance folder when unset
+    HISTORY_ARCHIVE_DIR = os.environ.get('HISTORY_ARCHIVE_DIR')
+    HISTORY_ARCHIVE_BATCH_SIZE = 1000
+    # Overdue reminder stages, in order. after_hours is measured from when the Chromebook was loaned
+    REMINDER_STAGES = [
+        {'name': 'reminder', 'label': 'Email Sent', 'after_hours': 24, 'recipient': 'user'},
+        {'name': 'escalation', 'label': 'Reception Notified', 'after_hours': 48, 'recipient': 'reception'},
+    ]
+    REMINDER_BATCH_SIZE = 100
+    # Minimum wait between one stage being sent and the next, so a late run never sends two stages at once
+    REMINDER_MIN_GAP_HOURS = 24
+    REMINDER_RETRY_MINUTES = 30
+    # After this many failed sends a stage is given up on and the next stage is scheduled
+    REMINDER_MAX_FAILURES = 5
+    RECEPTION_EMAIL = 'reception@tiffingirls.org'
 
 class DevelopmentConfig(Config):
     # Development-specific configurations
@@ -1,4 +1,12 @@
-from app import send_overdue_emails
+import os
+import logging
+from app import send_overdue_emails, archive_history
 
 if __name__ == "__main__":
-    send_overdue_emails()
\ No newline at end of file
+    send_overdue_emails()
+
+    # Archiving deletes history from the database, so only do it into an explicitly configured, persistent archive
+    if os.environ.get('HISTORY_ARCHIVE_DIR'):
+        archive_history()
+    else:
+        logging.info("HISTORY_ARCHIVE_DIR is not set. Skipping history archiving.")